@@ -1,9 +1,21 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, g
 from flask_cors import CORS
 import logging
 import os
+import time
 from backend.config import config
 from backend.routes.analysis import analysis_bp
+from backend.routes.admin import admin_bp
+from backend.services.scheduler import LLMScheduler, parse_client_weights
+from backend.services.reference_library import ReferenceLibrary
+from backend.services.usage import UsageTracker, AdaptiveMaxTokens
+from backend.utils.shared_state import create_backend
+from backend.utils.admission import AdmissionController
+
+# Endpoints that never queue behind admission control (liveness checks)
+ADMISSION_EXEMPT_ENDPOINTS = {'health', 'analysis.health_check'}
+# Endpoints that run for minutes by design, admitted under their own budget
+LONG_SESSION_ENDPOINTS = {'analysis.generate_long_report'}
 
 # Configure logging
 logging.basicConfig(
@@ -34,8 +46,104 @@ def create_app(config_name=None):
         }}
     )
     
+    # Shared state for rate limits and caches
+    app.extensions['shared_state'] = create_backend(app.config['RATELIMIT_STORAGE_URL'])
+    
+    # Fair-share scheduler for upstream LLM calls, slots shared across workers
+    app.extensions['llm_scheduler'] = LLMScheduler(
+        max_concurrency=app.config['GROQ_MAX_CONCURRENCY'],
+        batch_max_concurrency=app.config['GROQ_BATCH_MAX_CONCURRENCY'],
+        client_weights=parse_client_weights(app.config['GROQ_CLIENT_WEIGHTS']),
+        queue_timeout=app.config['GROQ_QUEUE_TIMEOUT'],
+        batch_queue_timeout=app.config['GROQ_BATCH_QUEUE_TIMEOUT'],
+        shared_state=app.extensions['shared_state']
+    )
+    
+    # Admission control, applied before request bodies are parsed, shared across workers
+    admission = AdmissionController(
+        max_inflight_bytes=app.config['ADMISSION_MAX_INFLIGHT_BYTES'],
+        min_concurrency=app.config['ADMISSION_MIN_CONCURRENCY'],
+        max_concurrency=app.config['ADMISSION_MAX_CONCURRENCY'],
+        latency_target=app.config['ADMISSION_LATENCY_TARGET'],
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+        shared_state=app.extensions['shared_state'],
+        lease_ttl=app.config['ADMISSION_LEASE_TTL']
+    )
+    app.extensions['admission'] = admission
+    
+    # Long sessions take minutes: a fixed concurrency budget of their own,
+    # kept out of the latency signal of the adaptive limit above. Streamed
+    # bodies are not buffered, so body size is not limited here
+    long_admission = AdmissionController(
+        max_inflight_bytes=None,
+        min_concurrency=app.config['ADMISSION_LONG_MAX_CONCURRENCY'],
+        max_concurrency=app.config['ADMISSION_LONG_MAX_CONCURRENCY'],
+        latency_target=None,
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+        shared_state=app.extensions['shared_state'],
+        lease_ttl=app.config['ADMISSION_LONG_LEASE_TTL'],
+        name='admission_long'
+    )
+    app.extensions['admission_long'] = long_admission
+    
+    @app.before_request
+    def admit_request():
+        # Health, admin, unknown routes and CORS preflight requests bypass admission
+        if (request.method == 'OPTIONS' or not request.path.startswith('/api/')
+                or request.endpoint is None or request.blueprint == 'admin'
+                or request.endpoint in ADMISSION_EXEMPT_ENDPOINTS):
+            return None
+        
+        controller = long_admission if request.endpoint in LONG_SESSION_ENDPOINTS else admission
+        nbytes = request.content_length
+        if nbytes is None:
+            # Body size unknown (chunked), assume the worst case
+            nbytes = app.config['MAX_CONTENT_LENGTH'] if request.method == 'POST' else 0
+        
+        lease = controller.try_admit(nbytes)
+        if lease is None:
+            retry_after = controller.retry_after()
+            logger.warning(f"Request rejected by admission control: {request.path}")
+            response = jsonify({
+                'success': False,
+                'error': 'Server overloaded. Please retry later.',
+                'retry_after': retry_after
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        
+        g.admission = (controller, lease, time.monotonic())
+        return None
+    
+    @app.teardown_request
+    def release_request(error=None):
+        admitted = g.pop('admission', None)
+        if admitted is not None:
+            controller, lease, started = admitted
+            controller.release(lease, time.monotonic() - started)
+    
+    # Upstream token/latency accounting and adaptive max_tokens
+    app.extensions['usage_tracker'] = UsageTracker(
+        shared_state=app.extensions['shared_state'],
+        window_seconds=app.config['USAGE_WINDOW_SECONDS'],
+        bucket_seconds=app.config['USAGE_BUCKET_SECONDS']
+    )
+    app.extensions['token_policy'] = AdaptiveMaxTokens(
+        ceiling=app.config['GROQ_MAX_TOKENS_CEILING'],
+        latency_budget=app.config['GROQ_LATENCY_BUDGET']
+    ) if app.config['ADAPTIVE_MAX_TOKENS'] else None
+    
+    # Reference movements compared against each session
+    library = None
+    if app.config['REFERENCE_LIBRARY_PATH']:
+        library = ReferenceLibrary()
+        library.load_directory(app.config['REFERENCE_LIBRARY_PATH'])
+    app.extensions['reference_library'] = library
+    
     # Register blueprints
     app.register_blueprint(analysis_bp)
+    app.register_blueprint(admin_bp)
     
     # Error handlers
     @app.errorhandler(404)
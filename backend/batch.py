@@ -0,0 +1,328 @@
+"""
+Offline batch re-analysis of archived session files.
+
+Usage:
+    python -m backend.batch SESSIONS_DIR [SESSIONS_DIR ...] --output results.jsonl
+
+Every *.json file under the given directories is loaded, validated and
+scored in a process pool; valid sessions are then sent to Groq with bounded
+concurrency. One JSON line is written per session. The output file doubles
+as a checkpoint: re-running with the same --output skips sessions that
+already completed, so an interrupted run resumes where it stopped.
+
+Record status is "ok" (report generated), "metrics" (--metrics-only run,
+no report), "invalid" or "error". A full run re-processes "metrics" and
+"error" sessions. When a run finishes the file is compacted to the last
+record per session path.
+
+With a reference library (--references, default REFERENCE_LIBRARY_PATH)
+each valid record carries its nearest reference movements, which are also
+given to the report prompt.
+
+Upstream calls are scheduled at batch priority as client "batch-cli"
+through the shared scheduler state (RATELIMIT_STORAGE_URL), waiting
+without timeout for free slots.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Optional, Set
+from backend.config import Config
+from backend.services.groq_service import GroqService
+from backend.services.reference_library import ReferenceLibrary
+from backend.services.scheduler import LLMScheduler, BATCH, parse_client_weights
+from backend.services.session_summarizer import (
+    SessionSummarizer, sort_frames, iter_windows, aggregate_window_matches
+)
+from backend.utils.metrics import summarize_frames
+from backend.utils.shared_state import create_backend, MemoryBackend
+from backend.utils.validators import validate_analysis_request, MAX_FRAMES
+
+logger = logging.getLogger('backend.batch')
+
+# Reference library of a worker process, loaded once by init_worker
+_reference_library: Optional[ReferenceLibrary] = None
+
+def init_worker(references_path: Optional[str]) -> None:
+    """Process pool initializer loading the reference library"""
+    global _reference_library
+    if references_path:
+        _reference_library = ReferenceLibrary()
+        _reference_library.load_directory(references_path)
+
+def match_references(metadata: Dict, frames: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Nearest reference movements for a session, like the API does: matched
+    as a whole up to MAX_FRAMES, per window and aggregated beyond.
+    """
+    if not _reference_library:
+        return None
+    k, max_distance = Config.REFERENCE_MATCHES, Config.REFERENCE_MAX_DISTANCE
+    if len(frames) <= MAX_FRAMES:
+        return _reference_library.find_nearest(frames, k=k, max_distance=max_distance)
+    windows = iter_windows(metadata, sort_frames(frames), Config.LONG_SESSION_WINDOW_SECONDS, len(frames))
+    return aggregate_window_matches(
+        [_reference_library.find_nearest(w['frames'], k=k, max_distance=max_distance) for w in windows],
+        k
+    )
+
+def find_sessions(directories: List[str]) -> Iterator[str]:
+    """Yield absolute paths of all session JSON files, in a stable order"""
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.json'):
+                    yield os.path.abspath(os.path.join(root, name))
+
+def load_checkpoint(output_path: str, metrics_only: bool = False) -> Set[str]:
+    """
+    Return the session paths already completed in a previous run.
+    Sessions that failed upstream are not included, so they are retried,
+    and metrics-only records only count as done for a metrics-only run.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            status = record.get('status')
+            if (status == 'invalid' or (status == 'ok' and 'report' in record)
+                    or (status == 'metrics' and metrics_only)):
+                completed.add(record.get('path'))
+    return completed
+
+def compact_output(output_path: str) -> None:
+    """
+    Rewrite the output keeping only the last record per session path
+    (resumed runs append new records for retried sessions).
+    """
+    records = {}
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records.pop(record.get('path'), None)
+            records[record.get('path')] = record
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records.values():
+            f.write(json.dumps(record) + '\n')
+    os.replace(tmp_path, output_path)
+
+def prepare_session(path: str) -> Dict:
+    """
+    Load, validate and score one session file (runs in a worker process).
+    """
+    record = {'path': path}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        record.update(status='invalid', error=f"Could not read session: {str(e)}")
+        return record
+
+    is_valid, error_msg = validate_analysis_request(data, max_frames=Config.LONG_SESSION_MAX_FRAMES)
+    if not is_valid:
+        record.update(status='invalid', error=error_msg)
+        return record
+
+    frames = data['frames']
+    record.update(
+        status='ok',
+        timestamp=data['metadata'].get('timestamp'),
+        frameCount=len(frames),
+        metrics=summarize_frames(frames),
+        data=data
+    )
+    try:
+        references = match_references(data['metadata'], frames)
+    except Exception as e:
+        logger.error(f"Reference matching failed for {path}: {str(e)}")
+        references = None
+    if references is not None:
+        record['referenceMatches'] = references
+    return record
+
+def analyze_session(groq_service: GroqService, record: Dict) -> Dict:
+    """
+    Generate the report for a prepared session (runs in a thread).
+    """
+    data = record.pop('data')
+    metadata, frames = data['metadata'], data['frames']
+    references = record.get('referenceMatches')
+    try:
+        if len(frames) > MAX_FRAMES:
+            # The batch concurrency already bounds upstream calls
+            summarizer = SessionSummarizer(
+                groq_service,
+                window_seconds=Config.LONG_SESSION_WINDOW_SECONDS,
+                concurrency=1,
+                reduce_fanout=Config.LONG_SESSION_REDUCE_FANOUT
+            )
+            result = summarizer.generate_report(metadata, sort_frames(frames), reference_matches=references)
+            record.update(report=result['report'], windowCount=result['windowCount'])
+        else:
+            record['report'] = groq_service.generate_movement_report(
+                metadata, frames, reference_matches=references
+            )
+    except Exception as e:
+        record.update(status='error', error=str(e))
+    return record
+
+class Progress:
+    """Throughput reporting for a batch run"""
+
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.started = time.time()
+        self.last_report = self.started
+        self.counts = {'ok': 0, 'metrics': 0, 'invalid': 0, 'error': 0}
+        self.frames = 0
+
+    def record(self, record: Dict) -> None:
+        self.counts[record['status']] += 1
+        self.frames += record.get('frameCount', 0)
+        now = time.time()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self) -> None:
+        done = sum(self.counts.values())
+        elapsed = max(time.time() - self.started, 1e-6)
+        logger.info(
+            f"{done}/{self.total} sessions "
+            f"({self.counts['ok']} ok, {self.counts['metrics']} metrics, "
+            f"{self.counts['invalid']} invalid, {self.counts['error']} error) - "
+            f"{done / elapsed:.1f} sessions/s, {self.frames / elapsed:.0f} frames/s"
+        )
+
+def run(args: argparse.Namespace) -> int:
+    completed = load_checkpoint(args.output, args.metrics_only)
+    paths = [p for p in find_sessions(args.directories) if p not in completed]
+    logger.info(f"{len(paths)} sessions to process ({len(completed)} already completed)")
+    if not paths:
+        return 0
+
+    groq_service = None
+    if not args.metrics_only:
+        # Queue through the API's scheduler state so batch calls count against
+        # the same upstream quota, behind interactive traffic
+        shared_state = create_backend(Config.RATELIMIT_STORAGE_URL)
+        if isinstance(shared_state, MemoryBackend):
+            logger.warning("RATELIMIT_STORAGE_URL is not shared, upstream calls are "
+                           "not counted against the API workers' quota")
+        scheduler = LLMScheduler(
+            max_concurrency=Config.GROQ_MAX_CONCURRENCY,
+            batch_max_concurrency=Config.GROQ_BATCH_MAX_CONCURRENCY,
+            client_weights=parse_client_weights(Config.GROQ_CLIENT_WEIGHTS),
+            shared_state=shared_state
+        )
+        try:
+            groq_service = GroqService(
+                os.environ.get('GROQ_API_KEY'),
+                scheduler=scheduler,
+                client_id='batch-cli',
+                priority=BATCH
+            )
+        except ValueError as e:
+            logger.error(str(e))
+            return 2
+
+    progress = Progress(len(paths), args.progress_interval)
+    path_iter = iter(paths)
+    preparing = {}
+    analyzing = set()
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.references,)) as processes, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as threads, \
+            open(args.output, 'a', encoding='utf-8') as out:
+
+        def write(record: Dict) -> None:
+            record.pop('data', None)
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            progress.record(record)
+
+        while True:
+            # Keep both pools busy without loading every session at once
+            while len(preparing) < args.workers * 2 and len(analyzing) < args.concurrency * 2:
+                path = next(path_iter, None)
+                if path is None:
+                    break
+                preparing[processes.submit(prepare_session, path)] = path
+
+            if not preparing and not analyzing:
+                break
+
+            done, _ = wait(list(preparing) + list(analyzing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in analyzing:
+                    analyzing.discard(future)
+                    write(future.result())
+                    continue
+
+                path = preparing.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {'path': path, 'status': 'error', 'error': str(e)}
+
+                if record['status'] == 'ok' and groq_service is not None:
+                    analyzing.add(threads.submit(analyze_session, groq_service, record))
+                else:
+                    if record['status'] == 'ok':
+                        record['status'] = 'metrics'
+                    write(record)
+
+    compact_output(args.output)
+    progress.report()
+    return 1 if progress.counts['error'] else 0
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m backend.batch',
+        description='Re-analyze archived session JSON files in bulk.'
+    )
+    parser.add_argument('directories', nargs='+', help='Directories containing session *.json files')
+    parser.add_argument('-o', '--output', required=True, help='JSONL results file (also used as checkpoint)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes used for validation and metrics (default: CPU count)')
+    parser.add_argument('-c', '--concurrency', type=int, default=4,
+                        help='Maximum concurrent Groq API calls (default: 4)')
+    parser.add_argument('--metrics-only', action='store_true',
+                        help='Only validate and compute metrics, do not call Groq')
+    parser.add_argument('--references', default=Config.REFERENCE_LIBRARY_PATH,
+                        help='Reference movement directory (default: REFERENCE_LIBRARY_PATH, '
+                             'empty string to disable)')
+    parser.add_argument('--progress-interval', type=float, default=10.0,
+                        help='Seconds between throughput reports (default: 10)')
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.concurrency < 1:
+        parser.error('--workers and --concurrency must be at least 1')
+    return args
+
+def main(argv: List[str] = None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    return run(parse_args(sys.argv[1:] if argv is None else argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
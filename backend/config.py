@@ -9,13 +9,76 @@ class Config:
     # API Keys (from environment only, NEVER hardcoded)
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
     
+    # Admin endpoints (disabled when unset)
+    ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+    
     # CORS
     CORS_ORIGIN = os.environ.get('CORS_ORIGIN', 'http://localhost:3000')
     
     # Rate Limiting
-    RATELIMIT_STORAGE_URL = "memory://"
+    # Shared state backend for rate limits and caches:
+    # memory:// (per worker) or sqlite:///path/to/state.db (shared across workers)
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
     RATELIMIT_STRATEGY = "fixed-window"
     
+    # Report cache (identical payloads reuse the generated report, 0 disables)
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 3600))
+    # Max time identical concurrent requests wait for one in-progress report
+    # before getting 503 with Retry-After
+    REPORT_CACHE_WAIT = float(os.environ.get('REPORT_CACHE_WAIT', 5))
+    
+    # Upstream scheduling: concurrency, batch share and the fair queue with
+    # per-client weights ("client=weight,...") are host-wide when
+    # RATELIMIT_STORAGE_URL is shared (sqlite://). Clients sending more than
+    # GROQ_INTERACTIVE_RATE report requests per minute are scheduled as batch
+    GROQ_MAX_CONCURRENCY = int(os.environ.get('GROQ_MAX_CONCURRENCY', 4))
+    GROQ_BATCH_MAX_CONCURRENCY = int(os.environ.get('GROQ_BATCH_MAX_CONCURRENCY', 2))
+    GROQ_QUEUE_TIMEOUT = float(os.environ.get('GROQ_QUEUE_TIMEOUT', 30))
+    GROQ_BATCH_QUEUE_TIMEOUT = float(os.environ.get('GROQ_BATCH_QUEUE_TIMEOUT', 30))
+    GROQ_CLIENT_WEIGHTS = os.environ.get('GROQ_CLIENT_WEIGHTS', '')
+    GROQ_INTERACTIVE_RATE = int(os.environ.get('GROQ_INTERACTIVE_RATE', 10))
+    
+    # Admission control (host-wide when RATELIMIT_STORAGE_URL is shared, e.g.
+    # sqlite://): requests beyond these limits wait up to
+    # ADMISSION_QUEUE_TIMEOUT seconds, then get 503 with Retry-After. With
+    # sync workers, keep ADMISSION_MAX_CONCURRENCY below the worker count,
+    # or the limit can never be reached
+    ADMISSION_MAX_INFLIGHT_BYTES = int(os.environ.get('ADMISSION_MAX_INFLIGHT_BYTES', 32 * 1024 * 1024))
+    ADMISSION_MIN_CONCURRENCY = int(os.environ.get('ADMISSION_MIN_CONCURRENCY', 1))
+    ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 4))
+    ADMISSION_LATENCY_TARGET = float(os.environ.get('ADMISSION_LATENCY_TARGET', 15))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2))
+    # Admission leases of a killed worker are reclaimed after this many seconds
+    # (must exceed the longest request)
+    ADMISSION_LEASE_TTL = float(os.environ.get('ADMISSION_LEASE_TTL', 120))
+    # /generate-long-report has a fixed budget of its own and no latency target
+    ADMISSION_LONG_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_LONG_MAX_CONCURRENCY', 1))
+    ADMISSION_LONG_LEASE_TTL = float(os.environ.get('ADMISSION_LONG_LEASE_TTL', 1800))
+    
+    # Upstream usage accounting (shared state counters in time buckets, so
+    # host-wide with a sqlite:// storage URL) and adaptive max_tokens (per worker)
+    USAGE_WINDOW_SECONDS = int(os.environ.get('USAGE_WINDOW_SECONDS', 86400))
+    USAGE_BUCKET_SECONDS = int(os.environ.get('USAGE_BUCKET_SECONDS', 3600))
+    ADAPTIVE_MAX_TOKENS = os.environ.get('ADAPTIVE_MAX_TOKENS', 'true').lower() == 'true'
+    GROQ_MAX_TOKENS_CEILING = int(os.environ.get('GROQ_MAX_TOKENS_CEILING', 2048))
+    GROQ_LATENCY_BUDGET = float(os.environ.get('GROQ_LATENCY_BUDGET', 20))
+    
+    # Long-session (map-reduce) analysis. Sessions over MAX_CONTENT_LENGTH are
+    # streamed as NDJSON, limited by LONG_SESSION_MAX_CONTENT_LENGTH instead
+    # (one hour at 2 frames/s is about 30MB). Map concurrency is capped at
+    # GROQ_BATCH_MAX_CONCURRENCY, as window calls are batch work
+    LONG_SESSION_MAX_FRAMES = int(os.environ.get('LONG_SESSION_MAX_FRAMES', 20000))
+    LONG_SESSION_MAX_CONTENT_LENGTH = int(os.environ.get('LONG_SESSION_MAX_CONTENT_LENGTH', 128 * 1024 * 1024))
+    LONG_SESSION_WINDOW_SECONDS = int(os.environ.get('LONG_SESSION_WINDOW_SECONDS', 60))
+    LONG_SESSION_CONCURRENCY = int(os.environ.get('LONG_SESSION_CONCURRENCY', 2))
+    LONG_SESSION_REDUCE_FANOUT = int(os.environ.get('LONG_SESSION_REDUCE_FANOUT', 8))
+    
+    # Reference movement library (directory of reference JSON files, disabled when unset)
+    REFERENCE_LIBRARY_PATH = os.environ.get('REFERENCE_LIBRARY_PATH')
+    REFERENCE_MATCHES = int(os.environ.get('REFERENCE_MATCHES', 3))
+    # Matches farther than this DTW distance (torso lengths per frame) are omitted, 0 for no limit
+    REFERENCE_MAX_DISTANCE = float(os.environ.get('REFERENCE_MAX_DISTANCE', 0)) or None
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     SESSION_COOKIE_SECURE = True
@@ -0,0 +1,52 @@
+from flask import Blueprint, request, jsonify, current_app
+from functools import wraps
+import hmac
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/v1/admin')
+
+def check_admin_key(f):
+    """Require the configured ADMIN_API_KEY as Bearer token"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        admin_key = current_app.config.get('ADMIN_API_KEY')
+        if not admin_key:
+            return jsonify({'error': 'Admin API disabled'}), 403
+        
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode('utf-8'), admin_key.encode('utf-8')):
+            return jsonify({'error': 'Invalid admin credentials'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+@admin_bp.route('/scheduler', methods=['GET'])
+@check_admin_key
+def scheduler_metrics():
+    """
+    Upstream scheduler queue and wait-time metrics for this worker
+    """
+    return jsonify(current_app.extensions['llm_scheduler'].metrics()), 200
+
+@admin_bp.route('/admission', methods=['GET'])
+@check_admin_key
+def admission_metrics():
+    """
+    Admission control limits and load across workers, with the separate
+    long-session budget under 'long_sessions'
+    """
+    metrics = current_app.extensions['admission'].metrics()
+    metrics['long_sessions'] = current_app.extensions['admission_long'].metrics()
+    return jsonify(metrics), 200
+
+@admin_bp.route('/usage', methods=['GET'])
+@check_admin_key
+def usage_metrics():
+    """
+    Upstream call, token and latency accounting across workers, with this
+    worker's current adaptive max_tokens per call kind
+    """
+    policy = current_app.extensions['token_policy']
+    return jsonify({
+        'usage': current_app.extensions['usage_tracker'].summary(),
+        'max_tokens': policy.snapshot() if policy else None
+    }), 200
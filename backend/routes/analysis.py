@@ -1,9 +1,17 @@
 from flask import Blueprint, request, jsonify, current_app
-from functools import wraps
+from functools import wraps, partial
+import hashlib
+import json
 import logging
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
 from backend.services.groq_service import GroqService
-from backend.utils.validators import validate_analysis_request
+from backend.services.scheduler import SchedulerTimeout, INTERACTIVE, BATCH
+from backend.services.session_summarizer import SessionSummarizer, sort_frames
+from backend.utils.validators import validate_analysis_request, read_session_stream, InvalidSessionError
 from backend.utils.rate_limit import rate_limit
+from backend.utils.shared_state import get_shared_state
 
 analysis_bp = Blueprint('analysis', __name__, url_prefix='/api/v1/analysis')
 logger = logging.getLogger(__name__)
@@ -18,6 +26,135 @@ def check_api_key(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _request_priority():
+    """
+    Scheduler priority class of the current request, decided server-side:
+    a client sending more than GROQ_INTERACTIVE_RATE report requests per
+    minute (across all workers) is scheduled as batch. Clients may lower
+    their own priority with X-Request-Priority: batch, never raise it.
+    """
+    client_ip = request.remote_addr or 'unknown'
+    window_id = int(time.time() // 60)
+    count = get_shared_state().incr(f"priority:{client_ip}:{window_id}", ttl=60)
+    if count > current_app.config['GROQ_INTERACTIVE_RATE']:
+        return BATCH
+    if request.headers.get('X-Request-Priority', '').lower() == BATCH:
+        return BATCH
+    return INTERACTIVE
+
+def _groq_service(priority=None):
+    """
+    GroqService for the current request, scheduled under the client's IP
+    at the given priority, or at _request_priority() when None.
+    """
+    if priority is None:
+        priority = _request_priority()
+    return GroqService(
+        current_app.config['GROQ_API_KEY'],
+        scheduler=current_app.extensions['llm_scheduler'],
+        client_id=request.remote_addr or 'unknown',
+        priority=priority,
+        usage_tracker=current_app.extensions['usage_tracker'],
+        token_policy=current_app.extensions['token_policy']
+    )
+
+def _reference_matcher():
+    """
+    find_nearest bound to the configured match count and distance limit,
+    or None without a reference library. Usable outside the app context.
+    """
+    library = current_app.extensions.get('reference_library')
+    if not library:
+        return None
+    return partial(
+        library.find_nearest,
+        k=current_app.config['REFERENCE_MATCHES'],
+        max_distance=current_app.config['REFERENCE_MAX_DISTANCE']
+    )
+
+def _reference_matches(frames):
+    """Nearest reference movements for the session, or None if unavailable"""
+    matcher = _reference_matcher()
+    if matcher is None:
+        return None
+    try:
+        return matcher(frames)
+    except Exception as e:
+        logger.error(f"Reference matching failed: {str(e)}")
+        return None
+
+def _overloaded_response():
+    """503 returned when the upstream queue wait exceeded its timeout"""
+    retry_after = int(current_app.config['GROQ_QUEUE_TIMEOUT'])
+    response = jsonify({
+        'success': False,
+        'error': 'Service busy. Please retry later.',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def _report_cache_key(kind, data):
+    """Cache key for a report request, derived from the full payload"""
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"report:{kind}:{digest}"
+
+class ReportInProgress(Exception):
+    """Raised when an identical report is still being generated elsewhere"""
+
+def _in_progress_response():
+    """503 asking the client to come back for the report being generated"""
+    retry_after = max(1, int(current_app.config['REPORT_CACHE_WAIT']))
+    response = jsonify({
+        'success': False,
+        'error': 'An identical report is being generated. Please retry shortly.',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def _cached_report(key, generate, lock_ttl):
+    """
+    Return a cached report result, generating and storing it on a miss.
+    
+    Only one request generates a given report at a time. Identical requests
+    arriving meanwhile wait up to REPORT_CACHE_WAIT seconds for its result,
+    then get ReportInProgress rather than holding a worker for the whole
+    generation. The in-progress marker expires after `lock_ttl` seconds (the
+    longest the generation may take), so a worker dying mid-generation
+    blocks identical requests no longer than that.
+    
+    Raises:
+        ReportInProgress: if the identical report did not finish in time
+    """
+    ttl = current_app.config['REPORT_CACHE_TTL']
+    if ttl <= 0:
+        return generate()
+    
+    store = get_shared_state()
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + current_app.config['REPORT_CACHE_WAIT']
+    
+    while True:
+        result = store.get(key)
+        if result is not None:
+            logger.info("Serving report from cache")
+            return result
+        
+        # First incr on a missing lock key takes the in-progress marker
+        if store.incr(lock_key, ttl=lock_ttl) == 1:
+            break
+        if time.monotonic() >= deadline:
+            raise ReportInProgress()
+        time.sleep(0.5)
+    
+    try:
+        result = generate()
+        store.set(key, result, ttl=ttl)
+        return result
+    finally:
+        store.delete(lock_key)
+
 @analysis_bp.route('/generate-report', methods=['POST'])
 @rate_limit(limit=100, window=3600)  # 100 requests per hour
 @check_api_key
@@ -54,8 +191,15 @@ def generate_report():
         logger.info(f"Processing analysis for {len(frames)} frames")
         
         # Call Groq API via service (API key never exposed to frontend)
-        groq_service = GroqService(current_app.config['GROQ_API_KEY'])
-        report = groq_service.generate_movement_report(metadata, frames)
+        groq_service = _groq_service()
+        report = _cached_report(
+            _report_cache_key('standard', data),
+            lambda: groq_service.generate_movement_report(
+                metadata, frames, reference_matches=_reference_matches(frames)
+            ),
+            # One upstream call: its queue wait plus the request timeout
+            lock_ttl=current_app.config['GROQ_QUEUE_TIMEOUT'] + GroqService.REQUEST_TIMEOUT
+        )
         
         return jsonify({
             'success': True,
@@ -64,6 +208,11 @@ def generate_report():
             'frameCount': len(frames)
         }), 200
         
+    except ReportInProgress:
+        return _in_progress_response()
+    except SchedulerTimeout as e:
+        logger.warning(f"Upstream queue timeout: {str(e)}")
+        return _overloaded_response()
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
         return jsonify({
@@ -71,6 +220,93 @@ def generate_report():
             'error': 'Failed to generate report. Please try again.'
         }), 500
 
+@analysis_bp.route('/generate-long-report', methods=['POST'])
+@rate_limit(limit=100, window=3600)  # 100 requests per hour
+@check_api_key
+def generate_long_report():
+    """
+    Generate AI analysis report for a long session (beyond 1000 frames).
+    
+    Accepts either the /generate-report JSON payload (within
+    MAX_CONTENT_LENGTH), or for sessions too large for that, a streamed
+    application/x-ndjson body: a first line {"metadata": {...}} followed by
+    one frame per line, ordered by 'second'. Streamed bodies are limited by
+    LONG_SESSION_MAX_CONTENT_LENGTH instead and are windowed and summarized
+    while they are read.
+    
+    The session is split into time windows that are summarized in parallel
+    and reduced into one report. Upstream calls are scheduled at batch
+    priority, leaving interactive requests their share of slots.
+    """
+    try:
+        streamed = request.mimetype == 'application/x-ndjson'
+        if not streamed and not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json or application/x-ndjson'}), 400
+        
+        max_frames = current_app.config['LONG_SESSION_MAX_FRAMES']
+        # Window and reduce calls run as batch work, so a long session never
+        # holds more than the batch share of upstream slots; more map
+        # concurrency than that would only queue against itself
+        summarizer = SessionSummarizer(
+            _groq_service(priority=BATCH),
+            window_seconds=current_app.config['LONG_SESSION_WINDOW_SECONDS'],
+            concurrency=min(current_app.config['LONG_SESSION_CONCURRENCY'],
+                            current_app.config['GROQ_BATCH_MAX_CONCURRENCY']),
+            reduce_fanout=current_app.config['LONG_SESSION_REDUCE_FANOUT'],
+            reference_matcher=_reference_matcher(),
+            reference_matches=current_app.config['REFERENCE_MATCHES']
+        )
+        
+        if streamed:
+            # Read the raw input so the route-specific limit applies instead of MAX_CONTENT_LENGTH
+            stream = get_input_stream(
+                request.environ,
+                max_content_length=current_app.config['LONG_SESSION_MAX_CONTENT_LENGTH']
+            )
+            metadata, frames = read_session_stream(stream, max_frames)
+            logger.info("Processing streamed long-session analysis")
+            result = summarizer.generate_report(metadata, frames)
+        else:
+            data = request.get_json()
+            
+            is_valid, error_msg = validate_analysis_request(data, max_frames=max_frames)
+            if not is_valid:
+                return jsonify({'error': error_msg}), 400
+            
+            metadata = data.get('metadata', {})
+            frames = sort_frames(data.get('frames', []))
+            
+            logger.info(f"Processing long-session analysis for {len(frames)} frames")
+            result = _cached_report(
+                _report_cache_key('long', data),
+                lambda: summarizer.generate_report(metadata, frames),
+                lock_ttl=current_app.config['ADMISSION_LONG_LEASE_TTL']
+            )
+        
+        return jsonify({
+            'success': True,
+            'report': result['report'],
+            'timestamp': metadata.get('timestamp'),
+            'frameCount': result['frameCount'],
+            'windowCount': result['windowCount']
+        }), 200
+        
+    except InvalidSessionError as e:
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Session exceeds maximum upload size'}), 413
+    except ReportInProgress:
+        return _in_progress_response()
+    except SchedulerTimeout as e:
+        logger.warning(f"Upstream queue timeout: {str(e)}")
+        return _overloaded_response()
+    except Exception as e:
+        logger.error(f"Error generating long-session report: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to generate report. Please try again.'
+        }), 500
+
 @analysis_bp.route('/health', methods=['GET'])
 def health_check():
     """
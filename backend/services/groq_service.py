@@ -1,7 +1,12 @@
 import requests
 import json
 import logging
-from typing import Dict, List, Any
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional
+from backend.services.scheduler import LLMScheduler, INTERACTIVE
+from backend.services.usage import UsageTracker, AdaptiveMaxTokens, payload_shape
+from backend.utils.metrics import summarize_frames
 
 logger = logging.getLogger(__name__)
 
@@ -13,30 +18,52 @@ class GroqService:
     
     BASE_URL = 'https://api.groq.com/openai/v1/chat/completions'
     MODEL = 'llama-3.3-70b-versatile'
+    WINDOW_MAX_TOKENS = 384
+    REQUEST_TIMEOUT = 30
     
-    def __init__(self, api_key: str):
-        """Initialize with API key from environment (backend only)"""
+    def __init__(self, api_key: str, scheduler: Optional[LLMScheduler] = None,
+                 client_id: str = 'anonymous', priority: str = INTERACTIVE,
+                 usage_tracker: Optional[UsageTracker] = None,
+                 token_policy: Optional[AdaptiveMaxTokens] = None):
+        """
+        Initialize with API key from environment (backend only).
+        
+        Args:
+            api_key: Groq API key
+            scheduler: Optional scheduler that upstream calls queue through
+            client_id: Client the calls are accounted to in the scheduler and usage
+            priority: Scheduler priority class (interactive or batch)
+            usage_tracker: Optional store for token and latency accounting
+            token_policy: Optional policy choosing max_tokens per call kind
+        """
         if not api_key:
             raise ValueError('GROQ_API_KEY not configured')
         self.api_key = api_key
+        self.scheduler = scheduler
+        self.client_id = client_id
+        self.priority = priority
+        self.usage_tracker = usage_tracker
+        self.token_policy = token_policy
     
-    def generate_movement_report(self, metadata: Dict, frames: List) -> str:
+    def generate_movement_report(self, metadata: Dict, frames: List,
+                                 reference_matches: Optional[List[Dict]] = None) -> str:
         """
         Generate comprehensive movement analysis report using Groq LLM.
         
         Args:
             metadata: Analysis metadata (timestamp, duration, totalFrames)
             frames: List of frame data with landmarks and features
+            reference_matches: Nearest reference movements from ReferenceLibrary
         
         Returns:
             str: Generated analysis report
         """
         try:
             # Build the prompt with analysis data
-            prompt = self._build_prompt(metadata, frames)
+            prompt = self._build_prompt(metadata, frames, reference_matches)
             
             # Call Groq API
-            response = self._call_groq_api(prompt)
+            response = self._call_groq_api(prompt, shape=payload_shape('frames', len(frames)))
             
             return response
             
@@ -47,11 +74,58 @@ class GroqService:
             logger.error(f"Error generating report: {str(e)}")
             raise
     
-    def _build_prompt(self, metadata: Dict, frames: List) -> str:
+    def summarize_window(self, metadata: Dict, window: Dict) -> str:
+        """
+        Summarize one time window of a long session (map step).
+        
+        Args:
+            metadata: Session metadata
+            window: Dict with index, start, end (seconds) and frames
+        
+        Returns:
+            str: Short factual summary of the window
+        """
+        try:
+            prompt = self._build_window_prompt(metadata, window)
+            return self._call_groq_api(
+                prompt, max_tokens=self.WINDOW_MAX_TOKENS, kind='window',
+                shape=payload_shape('frames', len(window['frames']))
+            )
+        except requests.RequestException as e:
+            logger.error(f"Groq API request failed: {str(e)}")
+            raise Exception(f"API call failed: {str(e)}")
+    
+    def reduce_summaries(self, metadata: Dict, summaries: List[str], final: bool = True,
+                         reference_matches: Optional[List[Dict]] = None) -> str:
+        """
+        Combine window summaries (reduce step).
+        
+        Args:
+            metadata: Session metadata
+            summaries: Ordered window (or partial) summaries
+            final: Produce the full user-facing report instead of a partial summary
+            reference_matches: Session-level reference matches (final report only)
+        
+        Returns:
+            str: Final report, or a condensed summary when final is False
+        """
+        try:
+            prompt = self._build_reduce_prompt(metadata, summaries, final, reference_matches)
+            shape = payload_shape('summaries', len(summaries))
+            if final:
+                return self._call_groq_api(prompt, kind='long_report', shape=shape)
+            return self._call_groq_api(prompt, max_tokens=self.WINDOW_MAX_TOKENS, kind='reduce', shape=shape)
+        except requests.RequestException as e:
+            logger.error(f"Groq API request failed: {str(e)}")
+            raise Exception(f"API call failed: {str(e)}")
+    
+    def _build_prompt(self, metadata: Dict, frames: List,
+                      reference_matches: Optional[List[Dict]] = None) -> str:
         """
         Build the prompt for Groq API.
         """
         frame_summary = json.dumps(frames[:5], indent=2) if frames else "No frames available"
+        references = self._format_reference_matches(reference_matches)
         
         prompt = f"""You are an expert in human movement analysis and biomechanics.
 Analyze the following pose detection data from a user's physical activity session (collected via MediaPipe Pose landmarks).
@@ -67,7 +141,7 @@ Sample Frame Structure (showing landmarks and features for {len(frames)} frames)
 Key Features:
 - Landmarks: 33 body points (nose, shoulders, hips, knees) with x,y,z coordinates and visibility scores.
 - Extracted Metrics: shoulder_pitch (degrees), torso_tilt (degrees), joint_velocity (px/s), step_symmetry (difference), quality_score (% visible landmarks).
-
+{references}
 Generate a comprehensive, professional movement report for the user. Structure it as follows:
 1. **Summary**: Overview of session
 2. **Key Metrics**: Break down averages for posture, balance, symmetry, motion
@@ -79,11 +153,99 @@ Make it engaging, actionable. Use bullet points/tables for readability. Base ana
         
         return prompt
     
-    def _call_groq_api(self, prompt: str) -> str:
+    def _format_reference_matches(self, reference_matches: Optional[List[Dict]]) -> str:
+        """
+        Format reference movement matches as a prompt section (empty if none).
+        """
+        if not reference_matches:
+            return ""
+        
+        lines = []
+        for match in reference_matches:
+            deviations = ", ".join(f"{joint} {value}" for joint, value in match['deviations'].items())
+            label = f" ({match['label']})" if match.get('label') else ""
+            windows = f"closest in {match['windows']} segments; " if match.get('windows') else ""
+            lines.append(f"- {match['name']}{label}: {windows}distance {match['distance']}; largest joint deviations: {deviations}")
+        
+        return (
+            "\nReference Movement Comparison (DTW distance to known reference movements, "
+            "in torso lengths per frame; lower is closer):\n"
+            + "\n".join(lines)
+            + "\nUse the closest reference to identify the movement and flag deviations from its form.\n"
+        )
+    
+    def _build_window_prompt(self, metadata: Dict, window: Dict) -> str:
+        """
+        Build the prompt summarizing a single window of a long session.
+        """
+        frames = window['frames']
+        metrics = json.dumps(summarize_frames(frames), indent=2)
+        sample = json.dumps(frames[:2], indent=2)
+        
+        return f"""You are an expert in human movement analysis and biomechanics.
+Summarize one segment of a longer pose detection session (MediaPipe Pose landmarks).
+
+Segment {window['index'] + 1}: {window['start']:.0f}s to {window['end']:.0f}s of a {metadata.get('duration', 'unknown')} second session.
+
+Computed metrics for this segment (scores 0-100):
+{metrics}
+
+Sample frames:
+{sample}
+
+Write at most 5 bullet points covering posture, balance, symmetry and any notable changes or risks in this segment. Be factual and concise; do not write recommendations or an overall score."""
+    
+    def _build_reduce_prompt(self, metadata: Dict, summaries: List[str], final: bool,
+                             reference_matches: Optional[List[Dict]] = None) -> str:
+        """
+        Build the prompt combining ordered segment summaries.
+        """
+        segments = "\n\n".join(
+            f"Segment {i + 1}:\n{summary}" for i, summary in enumerate(summaries)
+        )
+        
+        if not final:
+            return f"""You are an expert in human movement analysis and biomechanics.
+Condense the following consecutive segment summaries of a pose detection session into at most 6 bullet points, keeping trends, changes over time and risks.
+
+{segments}"""
+        
+        return f"""You are an expert in human movement analysis and biomechanics.
+The following are chronological summaries of segments of one long physical activity session (collected via MediaPipe Pose landmarks).
+
+Data Summary:
+- Duration: {metadata.get('duration', 'unknown')} seconds
+- Total Frames: {metadata.get('totalFrames', 0)}
+- Timestamp: {metadata.get('timestamp', 'unknown')}
+{self._format_reference_matches(reference_matches)}
+{segments}
+
+Generate a comprehensive, professional movement report for the user covering the whole session. Structure it as follows:
+1. **Summary**: Overview of session
+2. **Key Metrics**: Break down averages for posture, balance, symmetry, motion
+3. **Insights**: Analyze patterns, fatigue and changes over time
+4. **Recommendations**: Personalized tips and risk flags
+5. **Overall Score**: 0-100% efficiency rating
+
+Make it engaging, actionable. Use bullet points/tables for readability. Base analysis strictly on data—be positive and encouraging."""
+    
+    def _call_groq_api(self, prompt: str, max_tokens: int = 1024, kind: str = 'report',
+                       shape: str = 'unknown') -> str:
         """
         Make authenticated request to Groq API.
         API key is used server-side only - never sent to client.
+        
+        Every call that reached the upstream is accounted, failed or not.
+        
+        Args:
+            prompt: User prompt
+            max_tokens: Default completion limit, adapted by token_policy if set
+            kind: Call kind used for usage accounting and max_tokens adaptation
+            shape: Payload size bucket (see payload_shape) for usage accounting
         """
+        if self.token_policy:
+            max_tokens = self.token_policy.choose(kind, max_tokens)
+        
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
@@ -98,18 +260,26 @@ Make it engaging, actionable. Use bullet points/tables for readability. Base ana
                 }
             ],
             'temperature': 0.7,
-            'max_tokens': 1024,
+            'max_tokens': max_tokens,
             'top_p': 1,
             'stream': False
         }
         
+        slot = (self.scheduler.slot(self.client_id, self.priority)
+                if self.scheduler else nullcontext())
+        started = latency = None
+        usage, truncated, failed = {}, False, True
+        
         try:
-            response = requests.post(
-                self.BASE_URL,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            with slot:
+                started = time.monotonic()
+                response = requests.post(
+                    self.BASE_URL,
+                    json=payload,
+                    headers=headers,
+                    timeout=self.REQUEST_TIMEOUT
+                )
+                latency = time.monotonic() - started
             
             # Check for errors
             if response.status_code != 200:
@@ -124,6 +294,9 @@ Make it engaging, actionable. Use bullet points/tables for readability. Base ana
                 raise Exception("Invalid API response format")
             
             content = data['choices'][0]['message']['content']
+            usage = data.get('usage') or {}
+            truncated = data['choices'][0].get('finish_reason') == 'length'
+            failed = False
             logger.info("Successfully generated report via Groq API")
             
             return content
@@ -133,3 +306,35 @@ Make it engaging, actionable. Use bullet points/tables for readability. Base ana
         except Exception as e:
             logger.error(f"API call error: {str(e)}")
             raise
+        finally:
+            # Calls that never left the scheduler queue are not upstream usage
+            if started is not None:
+                if latency is None:
+                    latency = time.monotonic() - started
+                self._record_usage(kind, shape, usage, latency, max_tokens, truncated, failed)
+    
+    def _record_usage(self, kind: str, shape: str, usage: Dict, latency: float,
+                      max_tokens: int, truncated: bool, failed: bool) -> None:
+        """
+        Account the tokens and latency of one upstream call. Only successful
+        calls feed the max_tokens policy.
+        """
+        prompt_tokens = int(usage.get('prompt_tokens') or 0)
+        completion_tokens = int(usage.get('completion_tokens') or 0)
+        if failed:
+            outcome = 'failed'
+        else:
+            outcome = f"{prompt_tokens} prompt + {completion_tokens} completion tokens of max {max_tokens}"
+        logger.info(f"Groq usage ({kind}, {shape}, client {self.client_id}): {outcome} in {latency:.2f}s")
+        
+        try:
+            if self.usage_tracker:
+                self.usage_tracker.record(
+                    self.client_id, kind, shape, prompt_tokens, completion_tokens,
+                    latency, truncated, failed
+                )
+        except Exception as e:
+            # Accounting must never fail the call itself
+            logger.error(f"Failed to record usage: {str(e)}")
+        if self.token_policy and not failed:
+            self.token_policy.observe(kind, completion_tokens, latency, max_tokens, truncated)
@@ -0,0 +1,244 @@
+import heapq
+import json
+import logging
+import os
+import warnings
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Joints compared against references; each contributes x and y per frame
+JOINTS = (
+    'left_shoulder', 'right_shoulder', 'left_elbow', 'right_elbow',
+    'left_wrist', 'right_wrist', 'left_hip', 'right_hip',
+    'left_knee', 'right_knee', 'left_ankle', 'right_ankle'
+)
+SEQUENCE_LENGTH = 64
+
+def normalize_sequence(frames: List[Dict], length: int = SEQUENCE_LENGTH) -> np.ndarray:
+    """
+    Convert frames into a normalized (length, 2 * len(JOINTS)) array.
+
+    Coordinates are centered on the hip midpoint and scaled by the median
+    torso length, so position and distance to the camera do not matter.
+    Landmarks missing from a frame are interpolated over time, and the
+    sequence is resampled to a fixed length.
+    """
+    n = len(frames)
+    points = np.full((n, len(JOINTS), 2), np.nan)
+    for i, frame in enumerate(frames):
+        landmarks = frame.get('landmarks') or {}
+        if not isinstance(landmarks, dict):
+            continue
+        for j, name in enumerate(JOINTS):
+            point = landmarks.get(name)
+            if isinstance(point, dict) and 'x' in point and 'y' in point:
+                points[i, j] = (point['x'], point['y'])
+
+    with warnings.catch_warnings():
+        # All-NaN slices (joints never visible) are handled below
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        hips = np.nanmean(points[:, 6:8], axis=1)
+        shoulders = np.nanmean(points[:, 0:2], axis=1)
+        center = np.nanmean(hips, axis=0)
+        hips = np.where(np.isnan(hips), center, hips)
+        points -= np.nan_to_num(hips)[:, None, :]
+        torso = np.nanmedian(np.linalg.norm(shoulders - hips, axis=1))
+    if np.isfinite(torso) and torso > 1e-6:
+        points /= torso
+
+    flat = points.reshape(n, -1)
+    t = np.arange(n)
+    for col in range(flat.shape[1]):
+        valid = ~np.isnan(flat[:, col])
+        flat[:, col] = np.interp(t, t[valid], flat[valid, col]) if valid.any() else 0.0
+
+    grid = np.linspace(0, n - 1, length)
+    return np.stack([np.interp(grid, t, flat[:, col]) for col in range(flat.shape[1])], axis=1)
+
+def _envelope(sequences: np.ndarray, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Upper and lower LB_Keogh envelopes along the time axis (axis -2).
+    """
+    pad = [(0, 0)] * sequences.ndim
+    pad[-2] = (radius, radius)
+    upper = np.pad(sequences, pad, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(upper, 2 * radius + 1, axis=-2)
+    return windows.max(axis=-1), windows.min(axis=-1)
+
+def _dtw(query: np.ndarray, candidate: np.ndarray, radius: int,
+         abandon_above: float = np.inf) -> Tuple[float, Optional[np.ndarray]]:
+    """
+    Banded DTW with squared Euclidean frame cost.
+
+    Cells on one anti-diagonal only depend on the two previous ones, so each
+    anti-diagonal is computed as a single vectorized step. Every warping path
+    visits at least one of any two consecutive anti-diagonals, so once both
+    minima exceed `abandon_above` the final distance must too and the
+    computation stops early.
+
+    Returns:
+        (squared distance, accumulated cost matrix), or (inf, None) if abandoned
+    """
+    n = len(query)
+    cost = ((query[:, None, :] - candidate[None, :, :]) ** 2).sum(axis=-1)
+    acc = np.full((n + 1, n + 1), np.inf)
+    acc[0, 0] = 0.0
+    previous_min = 0.0
+
+    for d in range(2, 2 * n + 1):
+        lo = max(1, d - n, (d - radius + 1) // 2)
+        hi = min(n, d - 1, (d + radius) // 2)
+        if lo > hi:
+            continue
+        i = np.arange(lo, hi + 1)
+        j = d - i
+        acc[i, j] = cost[i - 1, j - 1] + np.minimum(
+            np.minimum(acc[i - 1, j], acc[i, j - 1]), acc[i - 1, j - 1]
+        )
+        current_min = acc[i, j].min()
+        if min(current_min, previous_min) > abandon_above:
+            return np.inf, None
+        previous_min = current_min
+
+    return acc[n, n], acc
+
+def _warping_path(acc: np.ndarray) -> List[Tuple[int, int]]:
+    """Backtrack the optimal warping path through an accumulated cost matrix"""
+    i = j = acc.shape[0] - 1
+    path = [(i - 1, j - 1)]
+    while i > 1 or j > 1:
+        steps = ((acc[i - 1, j - 1], i - 1, j - 1), (acc[i - 1, j], i - 1, j), (acc[i, j - 1], i, j - 1))
+        _, i, j = min(steps, key=lambda step: step[0])
+        path.append((i - 1, j - 1))
+    return path[::-1]
+
+class ReferenceLibrary:
+    """
+    Library of normalized reference movements (e.g. correct squat form)
+    searched by DTW similarity.
+
+    Candidates are ranked by an LB_Keogh lower bound computed for all
+    references at once; exact DTW only runs on candidates whose bound beats
+    the current k-th best distance, with early abandoning.
+    """
+
+    def __init__(self, length: int = SEQUENCE_LENGTH, window_fraction: float = 0.1):
+        self.length = length
+        self.radius = max(1, int(round(window_fraction * length)))
+        self._names = []
+        self._labels = []
+        self._sequences = []
+        self._stack = None
+        self._upper = None
+        self._lower = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, frames: List[Dict], label: Optional[str] = None) -> None:
+        """Normalize and store a reference movement"""
+        if not frames:
+            raise ValueError(f'Reference {name} has no frames')
+        self._names.append(name)
+        self._labels.append(label)
+        self._sequences.append(normalize_sequence(frames, self.length))
+        self._stack = None
+
+    def load_directory(self, path: str) -> int:
+        """
+        Load references from JSON files of the form
+        {"name": ..., "label": ..., "frames": [...]}.
+
+        Returns:
+            Number of references loaded
+        """
+        loaded = 0
+        for filename in sorted(os.listdir(path)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.add(
+                    data.get('name') or os.path.splitext(filename)[0],
+                    data.get('frames') or [],
+                    data.get('label')
+                )
+                loaded += 1
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping reference {filename}: {str(e)}")
+        logger.info(f"Loaded {loaded} reference movements from {path}")
+        return loaded
+
+    def _prepare(self) -> None:
+        if self._stack is None:
+            stack = np.stack(self._sequences)
+            self._upper, self._lower = _envelope(stack, self.radius)
+            # Published last: concurrent searches only check _stack
+            self._stack = stack
+
+    def _lower_bounds(self, query: np.ndarray) -> np.ndarray:
+        """LB_Keogh in both directions for every reference, keeping the tighter"""
+        upper, lower = _envelope(query, self.radius)
+        refs = self._stack
+        lb_query = (np.maximum(refs - upper, 0) ** 2 + np.maximum(lower - refs, 0) ** 2).sum(axis=(1, 2))
+        lb_refs = (np.maximum(query - self._upper, 0) ** 2
+                   + np.maximum(self._lower - query, 0) ** 2).sum(axis=(1, 2))
+        return np.maximum(lb_query, lb_refs)
+
+    def find_nearest(self, frames: List[Dict], k: int = 3,
+                     max_distance: Optional[float] = None) -> List[Dict]:
+        """
+        Find the k references closest to a session.
+
+        Args:
+            frames: Session frames
+            k: Maximum number of matches
+            max_distance: Omit references farther than this (same unit as
+                the returned distance); also used as the initial pruning bound
+
+        Returns:
+            Matches ordered by distance, each with name, label, distance
+            (RMS per frame, in torso lengths) and the joints deviating most
+        """
+        if k <= 0 or not self._names or not frames:
+            return []
+        self._prepare()
+        query = normalize_sequence(frames, self.length)
+        bounds = self._lower_bounds(query)
+        # Distances are compared squared and summed over frames
+        limit = np.inf if max_distance is None else max_distance ** 2 * self.length
+
+        best = []  # max-heap of (-distance, index, acc)
+        for index in np.argsort(bounds):
+            kth = -best[0][0] if len(best) == k else limit
+            if bounds[index] >= kth:
+                break
+            distance, acc = _dtw(query, self._stack[index], self.radius, kth)
+            if distance < kth:
+                entry = (-distance, int(index), acc)
+                if len(best) == k:
+                    heapq.heapreplace(best, entry)
+                else:
+                    heapq.heappush(best, entry)
+
+        matches = []
+        for neg_distance, index, acc in sorted(best, reverse=True):
+            matches.append({
+                'name': self._names[index],
+                'label': self._labels[index],
+                'distance': round(float(np.sqrt(-neg_distance / self.length)), 4),
+                'deviations': self._joint_deviations(query, self._stack[index], acc)
+            })
+        return matches
+
+    def _joint_deviations(self, query: np.ndarray, reference: np.ndarray,
+                          acc: np.ndarray, top: int = 3) -> Dict[str, float]:
+        """Mean per-joint distance along the warping path, largest first"""
+        path = np.array(_warping_path(acc))
+        diff = (query[path[:, 0]] - reference[path[:, 1]]).reshape(len(path), len(JOINTS), 2)
+        per_joint = np.linalg.norm(diff, axis=-1).mean(axis=0)
+        order = np.argsort(per_joint)[::-1][:top]
+        return {JOINTS[j]: round(float(per_joint[j]), 3) for j in order}
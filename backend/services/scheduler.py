@@ -0,0 +1,254 @@
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from backend.utils.shared_state import SharedStateBackend, SharedSemaphore, MemoryBackend
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waits longer than the queue timeout"""
+
+def parse_client_weights(value: str) -> Dict[str, float]:
+    """
+    Parse client weights from "client=weight,client=weight" format.
+    """
+    weights = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        client, _, weight = item.partition('=')
+        weights[client.strip()] = float(weight)
+    return weights
+
+class _Ticket:
+    __slots__ = ('id', 'client_id', 'priority', 'enqueued', 'start', 'leases')
+
+    def __init__(self, client_id: str, priority: str):
+        self.id = uuid.uuid4().hex
+        self.client_id = client_id
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.start = 0.0
+        self.leases = ()
+
+class LLMScheduler:
+    """
+    Fair-share scheduler for upstream LLM calls, shared by all workers.
+
+    At most `max_concurrency` calls run at once across all workers sharing
+    the `shared_state` backend, and batch calls never hold more than
+    `batch_max_concurrency` of those slots, keeping headroom for interactive
+    traffic.
+
+    Waiting calls are tickets in the shared backend, ordered by priority
+    class first (interactive before batch), then by start-time fair
+    queueing between clients within a class, so a client's share of slots
+    is proportional to its weight regardless of how many calls it queues
+    or which workers serve them. Only the ticket at the head of its class
+    may take a slot. Releases in other workers are not signalled, so
+    waiters poll every POLL_INTERVAL seconds (reading only, until they are
+    at the head) and refresh their ticket, letting tickets of a killed
+    worker expire after TICKET_TTL.
+
+    Batch calls wait up to `batch_queue_timeout` (default: queue_timeout).
+    """
+
+    POLL_INTERVAL = 0.05
+    # Slot leases outlive the 30 s upstream request timeout; a killed
+    # worker's slots come back after this
+    SLOT_LEASE_TTL = 120
+    TICKET_TTL = 10
+    # Finish tags of idle clients expire, which only loses their history
+    FINISH_TAG_TTL = 3600
+
+    def __init__(self, max_concurrency: int = 4, batch_max_concurrency: Optional[int] = None,
+                 client_weights: Optional[Dict[str, float]] = None,
+                 queue_timeout: Optional[float] = None, batch_queue_timeout: Optional[float] = None,
+                 shared_state: Optional[SharedStateBackend] = None, metrics_window: int = 1000):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1')
+        self.max_concurrency = max_concurrency
+        self.batch_max_concurrency = min(batch_max_concurrency or max_concurrency, max_concurrency)
+        self.client_weights = client_weights or {}
+        self.queue_timeouts = {
+            INTERACTIVE: queue_timeout,
+            BATCH: queue_timeout if batch_queue_timeout is None else batch_queue_timeout
+        }
+
+        self._state = shared_state or MemoryBackend()
+        self._slots = SharedSemaphore(self._state, 'llm_scheduler:slots', ttl=self.SLOT_LEASE_TTL)
+        self._batch_slots = SharedSemaphore(self._state, 'llm_scheduler:batch_slots',
+                                            ttl=self.SLOT_LEASE_TTL)
+
+        # Metrics of this worker's calls
+        self._lock = threading.Lock()
+        self._active = {p: 0 for p in PRIORITIES}
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._dispatched = {p: 0 for p in PRIORITIES}
+        self._timeouts = {p: 0 for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=metrics_window) for p in PRIORITIES}
+
+    @contextmanager
+    def slot(self, client_id: str, priority: str = INTERACTIVE) -> Iterator[None]:
+        """
+        Block until an upstream slot is granted, hold it for the duration
+        of the with-block.
+
+        Raises:
+            SchedulerTimeout: if no slot was granted within queue_timeout
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+        ticket = self._acquire(client_id, priority)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def _acquire(self, client_id: str, priority: str) -> _Ticket:
+        ticket = _Ticket(client_id, priority)
+        timeout = self.queue_timeouts[priority]
+        deadline = None if timeout is None else ticket.enqueued + timeout
+
+        self._enqueue(ticket)
+        with self._lock:
+            self._queued[priority] += 1
+        refreshed = ticket.enqueued
+
+        while not self._try_dispatch(ticket):
+            now = time.monotonic()
+            remaining = None if deadline is None else deadline - now
+            if remaining is not None and remaining <= 0:
+                self._state.delete(self._ticket_key(ticket))
+                with self._lock:
+                    self._queued[priority] -= 1
+                    self._timeouts[priority] += 1
+                raise SchedulerTimeout(f'No upstream slot available within {timeout}s')
+
+            if now - refreshed >= self.TICKET_TTL / 3:
+                self._state.set(self._ticket_key(ticket), self._ticket_value(ticket),
+                                ttl=self.TICKET_TTL)
+                refreshed = now
+            time.sleep(self.POLL_INTERVAL if remaining is None
+                       else min(remaining, self.POLL_INTERVAL))
+
+        with self._lock:
+            self._queued[priority] -= 1
+            self._active[priority] += 1
+            self._dispatched[priority] += 1
+            self._waits[priority].append(time.monotonic() - ticket.enqueued)
+        return ticket
+
+    def _release(self, ticket: _Ticket) -> None:
+        slot_lease, batch_lease = ticket.leases
+        with self._state.transaction():
+            self._slots.release(slot_lease)
+            if batch_lease is not None:
+                self._batch_slots.release(batch_lease)
+        with self._lock:
+            self._active[ticket.priority] -= 1
+
+    @staticmethod
+    def _ticket_key(ticket: _Ticket) -> str:
+        return f'llm_scheduler:queue:{ticket.priority}:{ticket.id}'
+
+    @staticmethod
+    def _ticket_value(ticket: _Ticket) -> Dict:
+        return {'start': ticket.start, 'client': ticket.client_id}
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        """Tag the ticket with its fair-queueing start time and queue it"""
+        priority = ticket.priority
+        weight = max(self.client_weights.get(ticket.client_id, 1.0), 1e-3)
+        tag_key = f'llm_scheduler:finish:{priority}:{ticket.client_id}'
+
+        with self._state.transaction():
+            vtime = float(self._state.get(f'llm_scheduler:vtime:{priority}', 0.0))
+            ticket.start = max(vtime, float(self._state.get(tag_key, 0.0)))
+            self._state.set(tag_key, ticket.start + 1.0 / weight, ttl=self.FINISH_TAG_TTL)
+            self._state.set(self._ticket_key(ticket), self._ticket_value(ticket),
+                            ttl=self.TICKET_TTL)
+
+    def _head(self, priority: str) -> Optional[str]:
+        """Id of the live ticket with the lowest start tag in a class"""
+        prefix = f'llm_scheduler:queue:{priority}:'
+        tickets = self._state.scan(prefix)
+        if not tickets:
+            return None
+        # Ties (same start tag) go to the lowest id, consistently in every worker
+        key = min(tickets, key=lambda k: (tickets[k]['start'], k))
+        return key[len(prefix):]
+
+    def _at_head(self, ticket: _Ticket) -> bool:
+        if ticket.priority == BATCH and self._head(INTERACTIVE) is not None:
+            return False
+        return self._head(ticket.priority) == ticket.id
+
+    def _try_dispatch(self, ticket: _Ticket) -> bool:
+        """Grant the ticket a slot if it is at the head of the shared queue"""
+        # Read-only check first: waiters behind the head never take the write lock
+        if not self._at_head(ticket) or self._slots.value() >= self.max_concurrency:
+            return False
+
+        with self._state.transaction():
+            if not self._at_head(ticket):
+                return False
+            batch_lease = None
+            if ticket.priority == BATCH:
+                batch_lease = self._batch_slots.try_acquire(self.batch_max_concurrency)
+                if batch_lease is None:
+                    return False
+            slot_lease = self._slots.try_acquire(self.max_concurrency)
+            if slot_lease is None:
+                if batch_lease is not None:
+                    self._batch_slots.release(batch_lease)
+                return False
+
+            self._state.delete(self._ticket_key(ticket))
+            self._state.set(f'llm_scheduler:vtime:{ticket.priority}', ticket.start)
+
+        ticket.leases = (slot_lease, batch_lease)
+        return True
+
+    def metrics(self) -> Dict:
+        """
+        Queue and wait-time metrics per priority class for this worker's
+        calls (wait times in ms), plus queued tickets and slots in use
+        across all workers.
+        """
+        with self._lock:
+            classes = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority])
+                classes[priority] = {
+                    'queued': self._queued[priority],
+                    'active': self._active[priority],
+                    'dispatched': self._dispatched[priority],
+                    'timeouts': self._timeouts[priority],
+                    'wait_ms': {
+                        'avg': round(1000 * sum(waits) / len(waits), 1) if waits else 0,
+                        'p50': _percentile_ms(waits, 0.50),
+                        'p95': _percentile_ms(waits, 0.95),
+                        'max': round(1000 * waits[-1], 1) if waits else 0
+                    }
+                }
+        for priority in PRIORITIES:
+            classes[priority]['global_queued'] = len(self._state.scan(f'llm_scheduler:queue:{priority}:'))
+        return {
+            'max_concurrency': self.max_concurrency,
+            'batch_max_concurrency': self.batch_max_concurrency,
+            'global_active': self._slots.value(),
+            'global_batch_active': self._batch_slots.value(),
+            'classes': classes
+        }
+
+def _percentile_ms(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return round(1000 * sorted_values[index], 1)
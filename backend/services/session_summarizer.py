@@ -0,0 +1,248 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from backend.services.groq_service import GroqService
+from backend.utils.validators import InvalidSessionError
+
+logger = logging.getLogger(__name__)
+
+def iter_windows(metadata: Dict, frames: Iterable[Dict], window_seconds: float,
+                 frame_count: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Split a session into consecutive time windows.
+
+    Frames are bucketed by their 'second' field; frames without one are
+    placed by index, spread evenly over the session duration (which needs
+    `frame_count`). `frames` may be any iterable, e.g. a stream: only the
+    window being built is held here, and windows are yielded as soon as the
+    first frame of the next window arrives.
+
+    Raises:
+        InvalidSessionError: if frames are not ordered by time
+    """
+    duration = float(metadata.get('duration') or 0)
+    step = duration / frame_count if frame_count else None
+    index = 0
+    window_start = None
+    window_frames = []
+    last_t = None
+
+    for i, frame in enumerate(frames):
+        second = frame.get('second')
+        if isinstance(second, (int, float)):
+            t = float(second)
+        elif step is not None:
+            t = i * step
+        else:
+            raise InvalidSessionError(f"Frame {i} missing numeric second")
+        if last_t is not None and t < last_t:
+            raise InvalidSessionError(f"Frame {i} is out of order (second {t} after {last_t})")
+        last_t = t
+
+        start = (t // window_seconds) * window_seconds
+        if window_frames and start > window_start:
+            yield {
+                'index': index,
+                'start': window_start,
+                'end': window_start + window_seconds,
+                'frames': window_frames
+            }
+            index += 1
+            window_frames = []
+        if not window_frames:
+            window_start = start
+        window_frames.append(frame)
+
+    if window_frames:
+        yield {
+            'index': index,
+            'start': window_start,
+            'end': window_start + window_seconds,
+            'frames': window_frames
+        }
+
+def sort_frames(frames: List[Dict]) -> List[Dict]:
+    """
+    Order a frame list by 'second' (stable, so frames within a second keep
+    their order). Lists where some frames lack a numeric second are
+    returned as-is, since their index then defines their time.
+    """
+    if all(isinstance(f.get('second'), (int, float)) for f in frames):
+        return sorted(frames, key=lambda f: f['second'])
+    return frames
+
+def aggregate_window_matches(window_matches: List[Optional[List[Dict]]], k: int = 3) -> List[Dict]:
+    """
+    Combine per-window reference matches into session-level matches.
+
+    Each window votes for its closest reference. References are ranked by
+    the number of windows they were closest in, then by mean distance;
+    distance and joint deviations are averaged over those windows.
+
+    Returns:
+        Up to k matches in the ReferenceLibrary.find_nearest format, each
+        with an extra 'windows' count
+    """
+    grouped = defaultdict(list)
+    for matches in window_matches:
+        if matches:
+            grouped[matches[0]['name']].append(matches[0])
+
+    aggregated = []
+    for name, closest in grouped.items():
+        deviations = defaultdict(list)
+        for match in closest:
+            for joint, value in match['deviations'].items():
+                deviations[joint].append(value)
+        mean_deviations = {joint: round(sum(values) / len(values), 3)
+                           for joint, values in deviations.items()}
+        aggregated.append({
+            'name': name,
+            'label': closest[0].get('label'),
+            'distance': round(sum(m['distance'] for m in closest) / len(closest), 4),
+            'deviations': dict(sorted(mean_deviations.items(), key=lambda item: -item[1])[:3]),
+            'windows': len(closest)
+        })
+
+    aggregated.sort(key=lambda match: (-match['windows'], match['distance']))
+    return aggregated[:max(k, 0)]
+
+class SessionSummarizer:
+    """
+    Hierarchical map-reduce report generation for long sessions.
+
+    The session is split into time windows which are summarized in parallel
+    (at most `concurrency` upstream calls in flight), then the summaries are
+    reduced in groups of `reduce_fanout` until one final report remains.
+
+    With a `reference_matcher` (e.g. a bound ReferenceLibrary.find_nearest),
+    every window is also matched against the reference movements and the
+    aggregated matches are given to the final reduce step.
+    """
+
+    def __init__(self, groq_service: GroqService, window_seconds: float = 60,
+                 concurrency: int = 4, reduce_fanout: int = 8,
+                 reference_matcher: Optional[Callable[[List[Dict]], List[Dict]]] = None,
+                 reference_matches: int = 3):
+        if window_seconds <= 0:
+            raise ValueError('window_seconds must be positive')
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        if reduce_fanout < 2:
+            raise ValueError('reduce_fanout must be at least 2')
+        self.groq_service = groq_service
+        self.window_seconds = window_seconds
+        self.concurrency = concurrency
+        self.reduce_fanout = reduce_fanout
+        self.reference_matcher = reference_matcher
+        self.reference_matches = reference_matches
+
+    def generate_report(self, metadata: Dict, frames: Iterable[Dict],
+                        reference_matches: Optional[List[Dict]] = None) -> Dict:
+        """
+        Generate the final report for a long session.
+
+        Args:
+            metadata: Session metadata
+            frames: Frame list, or an iterator streaming frames in time order
+            reference_matches: Precomputed session-level reference matches,
+                used instead of matching windows with `reference_matcher`
+
+        Returns:
+            Dict with the report, the number of windows summarized, the
+            number of frames consumed and the aggregated reference matches
+
+        Raises:
+            InvalidSessionError: if frames are out of order or the stream is invalid
+        """
+        frame_count = len(frames) if isinstance(frames, list) else None
+        counted = _CountingIterator(frames)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                results = self._map(executor, metadata, counted, frame_count)
+            except Exception:
+                # Do not spend upstream calls on windows of a rejected session
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            summaries = [summary for summary, _ in results]
+            references = reference_matches
+            if references is None and self.reference_matcher is not None:
+                references = aggregate_window_matches(
+                    [matches for _, matches in results], self.reference_matches
+                )
+            logger.info(f"Summarized {len(summaries)} windows, reducing")
+            report = self._reduce(executor, metadata, summaries, references)
+
+        return {
+            'report': report,
+            'windowCount': len(summaries),
+            'frameCount': counted.count,
+            'referenceMatches': references
+        }
+
+    def _map(self, executor: ThreadPoolExecutor, metadata: Dict, frames: Iterable[Dict],
+             frame_count: Optional[int]) -> List[Tuple[str, Optional[List[Dict]]]]:
+        """
+        Summarize (and match) every window, keeping at most `concurrency`
+        windows pending.
+        """
+        results = {}
+        pending = {}
+
+        for window in iter_windows(metadata, frames, self.window_seconds, frame_count):
+            if len(pending) >= self.concurrency:
+                self._collect(pending, results, wait(pending, return_when=FIRST_COMPLETED).done)
+            future = executor.submit(self._summarize_window, metadata, window)
+            pending[future] = window['index']
+
+        self._collect(pending, results, wait(pending).done)
+        return [results[i] for i in range(len(results))]
+
+    def _summarize_window(self, metadata: Dict, window: Dict) -> Tuple[str, Optional[List[Dict]]]:
+        summary = self.groq_service.summarize_window(metadata, window)
+        matches = None
+        if self.reference_matcher is not None:
+            try:
+                matches = self.reference_matcher(window['frames'])
+            except Exception as e:
+                logger.error(f"Reference matching failed for window {window['index']}: {str(e)}")
+        return summary, matches
+
+    @staticmethod
+    def _collect(pending: Dict, results: Dict, done) -> None:
+        for future in done:
+            results[pending.pop(future)] = future.result()
+
+    def _reduce(self, executor: ThreadPoolExecutor, metadata: Dict, summaries: List[str],
+                reference_matches: Optional[List[Dict]] = None) -> str:
+        """
+        Reduce summaries level by level until they fit in one final prompt.
+        """
+        while len(summaries) > self.reduce_fanout:
+            groups = [summaries[i:i + self.reduce_fanout]
+                      for i in range(0, len(summaries), self.reduce_fanout)]
+            summaries = list(executor.map(
+                lambda group: self.groq_service.reduce_summaries(metadata, group, final=False),
+                groups
+            ))
+
+        return self.groq_service.reduce_summaries(
+            metadata, summaries, final=True, reference_matches=reference_matches
+        )
+
+class _CountingIterator:
+    """Iterator wrapper counting the frames consumed"""
+
+    def __init__(self, frames: Iterable[Dict]):
+        self._frames = iter(frames)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict:
+        frame = next(self._frames)
+        self.count += 1
+        return frame
@@ -0,0 +1,186 @@
+import bisect
+import threading
+import time
+from collections import deque, defaultdict
+from typing import Dict, List, Optional
+from backend.utils.shared_state import SharedStateBackend, MemoryBackend
+
+# Upper bounds of the payload shape buckets (frames or summaries per call)
+SHAPE_BOUNDS = (10, 50, 100, 250, 500, 1000, 5000, 20000)
+
+# Upper bounds (ms) of the latency histogram used for percentiles
+LATENCY_BOUNDS_MS = (250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000)
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def payload_shape(unit: str, count: int) -> str:
+    """
+    Size bucket of an upstream call's input, e.g. 'frames<=500' or
+    'summaries<=10', so usage can be compared across payload sizes.
+    """
+    index = bisect.bisect_left(SHAPE_BOUNDS, count)
+    if index == len(SHAPE_BOUNDS):
+        return f"{unit}>{SHAPE_BOUNDS[-1]}"
+    return f"{unit}<={SHAPE_BOUNDS[index]}"
+
+class UsageTracker:
+    """
+    Accounting of upstream calls: requests, failures, prompt/completion
+    tokens and latency, aggregated in total, per client, per call kind and
+    per payload shape.
+
+    Counters live in the shared state backend in time buckets of
+    `bucket_seconds`, expiring once they fall out of `window_seconds`, so
+    with a sqlite:// backend the summary covers every worker and the whole
+    window regardless of traffic volume.
+    """
+
+    DIMENSIONS = ('total', 'client', 'kind', 'shape')
+
+    def __init__(self, shared_state: Optional[SharedStateBackend] = None,
+                 window_seconds: float = 86400, bucket_seconds: float = 3600):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = min(bucket_seconds, window_seconds)
+        self._state = shared_state or MemoryBackend()
+
+    def record(self, client_id: str, kind: str, shape: str, prompt_tokens: int,
+               completion_tokens: int, latency: float, truncated: bool, failed: bool) -> None:
+        bucket = int(time.time() // self.bucket_seconds)
+        ttl = self.window_seconds + self.bucket_seconds
+        latency_ms = int(round(1000 * latency))
+        fields = {
+            'requests': 1,
+            'failures': int(failed),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency_ms': latency_ms,
+            'truncated': int(truncated)
+        }
+        histogram = f"latency_le_{bisect.bisect_left(LATENCY_BOUNDS_MS, latency_ms)}"
+
+        amounts = {}
+        for dimension, name in (('total', '_'), ('client', client_id), ('kind', kind), ('shape', shape)):
+            # The name goes last as it may contain ':' (IPv6 clients)
+            prefix = f"usage:{bucket}:{dimension}"
+            for field, amount in fields.items():
+                if amount:
+                    amounts[f"{prefix}:{field}:{name}"] = amount
+            if dimension in ('total', 'kind'):
+                amounts[f"{prefix}:{histogram}:{name}"] = 1
+        # One atomic write per call (a single transaction on SQLite)
+        self._state.incr_many(amounts, ttl=ttl)
+
+    def summary(self) -> Dict:
+        """
+        Totals and per-client, per-kind and per-shape aggregates over the
+        window (to bucket granularity).
+        """
+        oldest = int((time.time() - self.window_seconds) // self.bucket_seconds) + 1
+        counters = {dimension: defaultdict(lambda: defaultdict(int)) for dimension in self.DIMENSIONS}
+
+        for key, value in self._state.scan('usage:').items():
+            _, bucket, dimension, field, name = key.split(':', 4)
+            if int(bucket) >= oldest and dimension in counters:
+                counters[dimension][name][field] += int(value)
+
+        return {
+            'window_seconds': self.window_seconds,
+            'bucket_seconds': self.bucket_seconds,
+            'totals': _aggregate(counters['total'].get('_', {})),
+            'clients': {name: _aggregate(c) for name, c in counters['client'].items()},
+            'kinds': {name: _aggregate(c) for name, c in counters['kind'].items()},
+            'shapes': {name: _aggregate(c) for name, c in counters['shape'].items()}
+        }
+
+def _aggregate(counters: Dict[str, int]) -> Dict:
+    requests = counters.get('requests', 0)
+    prompt = counters.get('prompt_tokens', 0)
+    completion = counters.get('completion_tokens', 0)
+    latency_total = counters.get('latency_ms', 0)
+    aggregated = {
+        'requests': requests,
+        'failures': counters.get('failures', 0),
+        'prompt_tokens': prompt,
+        'completion_tokens': completion,
+        'total_tokens': prompt + completion,
+        'truncated': counters.get('truncated', 0),
+        'latency_ms': {
+            'avg': round(latency_total / requests, 1) if requests else 0,
+            'total': latency_total
+        }
+    }
+    histogram = [counters.get(f"latency_le_{i}", 0) for i in range(len(LATENCY_BOUNDS_MS) + 1)]
+    if any(histogram):
+        aggregated['latency_ms']['p95_upper'] = _histogram_percentile(histogram, 0.95)
+    return aggregated
+
+def _histogram_percentile(histogram: List[int], fraction: float) -> Optional[int]:
+    """Upper bound of the latency bucket holding the percentile (None if beyond the last)"""
+    target = fraction * sum(histogram)
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            return LATENCY_BOUNDS_MS[index] if index < len(LATENCY_BOUNDS_MS) else None
+    return None
+
+class AdaptiveMaxTokens:
+    """
+    Choose max_tokens per call kind from observed completion lengths.
+
+    Once `min_samples` calls of a kind have been seen, max_tokens is the
+    p95 completion length times `headroom`, capped by what the upstream can
+    generate within `latency_budget` seconds at the observed tokens/second.
+    Truncated completions count as 1.5x their limit so the limit grows back.
+    Until then the caller's default is used.
+    """
+
+    def __init__(self, floor: int = 128, ceiling: int = 2048, headroom: float = 1.25,
+                 latency_budget: float = 20.0, min_samples: int = 20, samples: int = 200):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.headroom = headroom
+        self.latency_budget = latency_budget
+        self.min_samples = min_samples
+        self._completions = defaultdict(lambda: deque(maxlen=samples))
+        self._rates = defaultdict(lambda: deque(maxlen=samples))
+        self._lock = threading.Lock()
+
+    def choose(self, kind: str, default: int) -> int:
+        with self._lock:
+            completions = list(self._completions[kind])
+            rates = list(self._rates[kind])
+
+        if len(completions) < self.min_samples:
+            return default
+
+        target = _percentile(completions, 0.95) * self.headroom
+        if rates:
+            target = min(target, self.latency_budget * _percentile(rates, 0.5))
+        return int(max(self.floor, min(self.ceiling, target)))
+
+    def observe(self, kind: str, completion_tokens: int, latency: float,
+                max_tokens: int, truncated: bool) -> None:
+        with self._lock:
+            self._completions[kind].append(max_tokens * 1.5 if truncated else completion_tokens)
+            if completion_tokens and latency > 0:
+                self._rates[kind].append(completion_tokens / latency)
+
+    def snapshot(self) -> Dict:
+        """
+        Sample count and adaptive max_tokens per observed kind
+        (None while the caller's default is still used).
+        """
+        with self._lock:
+            kinds = {kind: len(samples) for kind, samples in self._completions.items()}
+        return {
+            kind: {
+                'samples': count,
+                'max_tokens': self.choose(kind, None)
+            }
+            for kind, count in kinds.items()
+        }
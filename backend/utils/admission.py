@@ -0,0 +1,130 @@
+import math
+import time
+from typing import Dict, Optional
+from backend.utils.shared_state import SharedStateBackend, SharedSemaphore, MemoryBackend
+
+class AdmissionController:
+    """
+    Admission control for incoming requests, shared by all workers.
+
+    A request is admitted while both the number of concurrent requests is
+    below the current limit and the total declared body size in flight stays
+    under `max_inflight_bytes`. Otherwise it waits up to `queue_timeout`
+    seconds for capacity and is then rejected.
+
+    The concurrency limit adapts with AIMD on observed latency: it grows by
+    roughly one per `limit` completions under `latency_target`, and is
+    multiplied by `decrease_factor` (at most once per latency_target) when a
+    request exceeds it. Without a latency_target the limit stays at
+    max_concurrency, and without max_inflight_bytes body size is not
+    limited; routes that are slow by design get such a controller of their
+    own (under a different `name`) so they neither skew the latency signal
+    nor compete with short requests.
+
+    In-flight leases, the limit and the latency average live in the
+    `shared_state` backend, so with a sqlite:// backend the limits hold for
+    the whole host rather than per worker. Each admitted request holds a
+    lease expiring after `lease_ttl` seconds (longer than any request may
+    run), which reclaims capacity leaked by a killed worker.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, max_inflight_bytes: Optional[int], min_concurrency: int = 1,
+                 max_concurrency: int = 4, latency_target: Optional[float] = 15.0,
+                 queue_timeout: float = 2.0, decrease_factor: float = 0.5,
+                 ewma_alpha: float = 0.2, shared_state: Optional[SharedStateBackend] = None,
+                 lease_ttl: float = 120, name: str = 'admission'):
+        if not 1 <= min_concurrency <= max_concurrency:
+            raise ValueError('Require 1 <= min_concurrency <= max_concurrency')
+        self.max_inflight_bytes = max_inflight_bytes
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.decrease_factor = decrease_factor
+        self.ewma_alpha = ewma_alpha
+        self.name = name
+
+        self._state = shared_state or MemoryBackend()
+        self._inflight = SharedSemaphore(self._state, f'{name}:inflight', ttl=lease_ttl)
+        self._inflight_bytes = SharedSemaphore(self._state, f'{name}:inflight_bytes', ttl=lease_ttl)
+
+    def _limit(self) -> float:
+        if self.latency_target is None:
+            return float(self.max_concurrency)
+        return float(self._state.get(f'{self.name}:limit', self.max_concurrency))
+
+    def _latency_ewma(self) -> float:
+        return float(self._state.get(f'{self.name}:latency_ewma', 0.0))
+
+    def _try_reserve(self, nbytes: int) -> Optional[str]:
+        with self._state.transaction():
+            lease = self._inflight.try_acquire(int(self._limit()))
+            if lease is None or nbytes <= 0 or self.max_inflight_bytes is None:
+                return lease
+            # A single oversized request is still admitted when nothing else is in flight
+            if self._inflight_bytes.try_acquire(self.max_inflight_bytes, nbytes, lease) is None:
+                self._inflight.release(lease)
+                return None
+            return lease
+
+    def try_admit(self, nbytes: int) -> Optional[str]:
+        """
+        Reserve capacity for a request with a body of `nbytes`.
+
+        Capacity freed by other workers is not signalled, so waiting
+        requests re-check every POLL_INTERVAL seconds.
+
+        Returns:
+            Lease id if admitted (release() must be called with it), None
+            if rejected
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            lease = self._try_reserve(nbytes)
+            if lease is not None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._state.incr(f'{self.name}:rejected')
+                return None
+            time.sleep(min(remaining, self.POLL_INTERVAL))
+
+        self._state.incr(f'{self.name}:admitted')
+        return lease
+
+    def release(self, lease: str, latency: float) -> None:
+        """Return capacity and adapt the concurrency limit"""
+        with self._state.transaction():
+            self._inflight.release(lease)
+            self._inflight_bytes.release(lease)
+
+            ewma = self._latency_ewma()
+            self._state.set(f'{self.name}:latency_ewma', ewma + self.ewma_alpha * (latency - ewma))
+            if self.latency_target is None:
+                return
+
+            limit = self._limit()
+            if latency > self.latency_target:
+                # Once per latency_target across workers: whoever creates the key decreases
+                if self._state.incr(f'{self.name}:decrease', ttl=self.latency_target) == 1:
+                    self._state.set(f'{self.name}:limit',
+                                    max(self.min_concurrency, limit * self.decrease_factor))
+            else:
+                self._state.set(f'{self.name}:limit', min(self.max_concurrency, limit + 1.0 / limit))
+
+    def retry_after(self) -> int:
+        """Suggested Retry-After in seconds, based on recent latency"""
+        return max(1, math.ceil(self._latency_ewma()))
+
+    def metrics(self) -> Dict:
+        return {
+            'limit': int(self._limit()),
+            'inflight': self._inflight.value(),
+            'inflight_bytes': self._inflight_bytes.value(),
+            'max_inflight_bytes': self.max_inflight_bytes,
+            'latency_ewma_ms': round(1000 * self._latency_ewma(), 1),
+            'admitted': int(self._state.get(f'{self.name}:admitted', 0)),
+            'rejected': int(self._state.get(f'{self.name}:rejected', 0))
+        }
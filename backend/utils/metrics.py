@@ -0,0 +1,81 @@
+import math
+from typing import Any, Dict, List, Optional
+
+# Metric names mirror calculateMetrics() in index-secure.js
+METRIC_NAMES = ('posture', 'balance', 'symmetry')
+
+def _point(landmarks: Dict, name: str) -> Optional[Dict]:
+    """Return a landmark dict if present with x/y coordinates"""
+    point = landmarks.get(name) if isinstance(landmarks, dict) else None
+    if not isinstance(point, dict) or 'x' not in point or 'y' not in point:
+        return None
+    return point
+
+def _distance(a: Dict, b: Dict) -> float:
+    return math.hypot(a['x'] - b['x'], a['y'] - b['y'])
+
+def compute_frame_metrics(landmarks: Dict) -> Dict[str, float]:
+    """
+    Compute posture, balance and symmetry scores (0-100) for one frame.
+
+    Landmarks are keyed by MediaPipe name, as sent by the frontend. Metrics
+    whose landmarks were not visible in the frame are omitted.
+    """
+    ls, rs = _point(landmarks, 'left_shoulder'), _point(landmarks, 'right_shoulder')
+    lh, rh = _point(landmarks, 'left_hip'), _point(landmarks, 'right_hip')
+    lk, rk = _point(landmarks, 'left_knee'), _point(landmarks, 'right_knee')
+    le, re = _point(landmarks, 'left_elbow'), _point(landmarks, 'right_elbow')
+
+    metrics = {}
+
+    if ls and rs and lh and rh:
+        sx, sy = rs['x'] - ls['x'], rs['y'] - ls['y']
+        hx, hy = rh['x'] - lh['x'], rh['y'] - lh['y']
+        mag_s, mag_h = math.hypot(sx, sy), math.hypot(hx, hy)
+        angle = 0.0
+        if mag_s > 0 and mag_h > 0:
+            cos = max(-1.0, min(1.0, (sx * hx + sy * hy) / (mag_s * mag_h)))
+            angle = math.degrees(math.acos(cos))
+        # Angle between shoulder and hip lines; 0 when they are parallel
+        metrics['posture'] = max(0.0, 100 - angle)
+
+    if lh and rh and lk and rk:
+        diff = abs(lh['y'] - rh['y']) + abs(lk['y'] - rk['y'])
+        metrics['balance'] = max(0.0, 100 - diff * 1000)
+
+    if ls and rs and le and re and lh and rh and lk and rk:
+        diff = (abs(_distance(ls, le) - _distance(rs, re))
+                + abs(_distance(lh, lk) - _distance(rh, rk)))
+        metrics['symmetry'] = max(0.0, 100 - diff * 500)
+
+    return metrics
+
+def summarize_frames(frames: List[Dict]) -> Dict[str, Any]:
+    """
+    Aggregate per-frame metrics over a list of frames.
+
+    Returns:
+        Dict with frame count, average visible landmarks and, for each
+        metric, its average/min/max over the frames where it was computable.
+    """
+    totals = {name: [] for name in METRIC_NAMES}
+    visible = 0
+
+    for frame in frames:
+        landmarks = frame.get('landmarks') or {}
+        visible += len(landmarks) if isinstance(landmarks, dict) else 0
+        for name, value in compute_frame_metrics(landmarks).items():
+            totals[name].append(value)
+
+    summary = {
+        'frames': len(frames),
+        'avg_visible_landmarks': round(visible / len(frames), 1) if frames else 0
+    }
+    for name, values in totals.items():
+        if values:
+            summary[name] = {
+                'avg': round(sum(values) / len(values), 1),
+                'min': round(min(values), 1),
+                'max': round(max(values), 1)
+            }
+    return summary
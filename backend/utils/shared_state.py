@@ -0,0 +1,379 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlparse
+from flask import current_app
+
+class SharedStateBackend(ABC):
+    """
+    Key-value store shared by rate limiters and caches.
+
+    Keys may carry a TTL in seconds; expired keys behave as missing.
+
+    Leases are a separate namespace: each holder of a key owns one lease
+    with its own expiry, used to build semaphores (see SharedSemaphore).
+    """
+
+    @abstractmethod
+    def transaction(self) -> Iterator[None]:
+        """Context manager making the enclosed operations atomic (may nest)"""
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add `amount` to a counter and return the new value.
+        The TTL is applied when the counter is created."""
+
+    @abstractmethod
+    def incr_many(self, amounts: Dict[str, int], ttl: Optional[float] = None) -> None:
+        """Atomically add to several counters at once (same TTL rule as incr)"""
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a key, or `default` if missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a JSON-serializable value"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove a key if present"""
+
+    @abstractmethod
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        """Return all live keys starting with `prefix` and their values"""
+
+    @abstractmethod
+    def acquire_lease(self, key: str, holder: str, limit: int, ttl: float,
+                      amount: int = 1) -> bool:
+        """Grant `holder` a lease of `amount` units on `key` expiring in `ttl`
+        seconds if the live leases plus `amount` stay within `limit` (a
+        single lease is always granted when no other is live). A refused
+        attempt writes nothing and never extends other leases."""
+
+    @abstractmethod
+    def release_lease(self, key: str, holder: str) -> None:
+        """Drop the lease of `holder` on `key` if present"""
+
+    @abstractmethod
+    def count_leases(self, key: str) -> int:
+        """Total amount of the live leases on `key`"""
+
+class MemoryBackend(SharedStateBackend):
+    """
+    In-process store. Only shared between threads of one worker.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._data = {}
+        self._leases = {}
+        self._lock = threading.RLock()
+        self._ops = 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._lock:
+            yield
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def _live(self, key: str, now: float):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _maybe_purge(self, now: float) -> None:
+        self._ops += 1
+        if self._ops % self.PURGE_EVERY == 0:
+            expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+            for k in expired:
+                del self._data[k]
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            now = time.time()
+            self._maybe_purge(now)
+            entry = self._live(key, now)
+            if entry is None:
+                value, expires_at = amount, self._expires_at(ttl)
+            else:
+                value = int(entry[0]) + amount
+                expires_at = entry[1]
+            self._data[key] = (value, expires_at)
+            return value
+
+    def incr_many(self, amounts: Dict[str, int], ttl: Optional[float] = None) -> None:
+        with self._lock:
+            for key, amount in amounts.items():
+                self.incr(key, amount, ttl)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(key, time.time())
+            return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.time()
+            self._maybe_purge(now)
+            self._data[key] = (value, self._expires_at(ttl))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        with self._lock:
+            now = time.time()
+            return {
+                key: value for key, (value, exp) in self._data.items()
+                if key.startswith(prefix) and (exp is None or exp > now)
+            }
+
+    def _live_leases(self, key: str, now: float) -> Dict[str, tuple]:
+        leases = self._leases.setdefault(key, {})
+        for holder in [h for h, (_, exp) in leases.items() if exp <= now]:
+            del leases[holder]
+        return leases
+
+    def acquire_lease(self, key: str, holder: str, limit: int, ttl: float,
+                      amount: int = 1) -> bool:
+        with self._lock:
+            now = time.time()
+            leases = self._live_leases(key, now)
+            total = sum(a for a, _ in leases.values())
+            if leases and total + amount > limit:
+                return False
+            leases[holder] = (amount, now + ttl)
+            return True
+
+    def release_lease(self, key: str, holder: str) -> None:
+        with self._lock:
+            self._leases.get(key, {}).pop(holder, None)
+
+    def count_leases(self, key: str) -> int:
+        with self._lock:
+            return sum(a for a, _ in self._live_leases(key, time.time()).values())
+
+class SQLiteBackend(SharedStateBackend):
+    """
+    SQLite (WAL mode) store shared by all worker processes on one host.
+
+    Values are stored as JSON. Each thread/process opens its own connection,
+    so the backend is safe to create before gunicorn forks workers.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ops = 0
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS shared_state ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS shared_leases ('
+            'key TEXT NOT NULL, holder TEXT NOT NULL, amount INTEGER NOT NULL, '
+            'expires_at REAL NOT NULL, PRIMARY KEY (key, holder))'
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # BEGIN IMMEDIATE takes the write lock up front, so read-then-write
+        # sequences inside the block cannot interleave with other processes
+        conn = self._connect()
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = depth + 1
+        try:
+            yield
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        self._local.depth = depth
+        if depth == 0:
+            conn.execute('COMMIT')
+
+    def _maybe_purge(self, conn: sqlite3.Connection, now: float) -> None:
+        self._ops += 1
+        if self._ops % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM shared_state WHERE expires_at <= ?', (now,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        conn = self._connect()
+        now = time.time()
+        with self.transaction():
+            self._upsert_counters(conn, {key: amount}, ttl, now)
+            row = conn.execute('SELECT value FROM shared_state WHERE key = ?', (key,)).fetchone()
+        self._maybe_purge(conn, now)
+        return int(row[0])
+
+    def incr_many(self, amounts: Dict[str, int], ttl: Optional[float] = None) -> None:
+        conn = self._connect()
+        now = time.time()
+        with self.transaction():
+            self._upsert_counters(conn, amounts, ttl, now)
+        self._maybe_purge(conn, now)
+
+    @staticmethod
+    def _upsert_counters(conn: sqlite3.Connection, amounts: Dict[str, int],
+                         ttl: Optional[float], now: float) -> None:
+        expires_at = now + ttl if ttl else None
+        conn.executemany(
+            'INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            'value = CASE WHEN expires_at <= ? THEN excluded.value '
+            'ELSE CAST(value AS INTEGER) + ? END, '
+            'expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at '
+            'ELSE expires_at END',
+            [(key, str(amount), expires_at, now, amount, now) for key, amount in amounts.items()]
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._connect().execute(
+            'SELECT value FROM shared_state WHERE key = ? '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), now + ttl if ttl else None)
+        )
+        self._maybe_purge(conn, now)
+
+    def delete(self, key: str) -> None:
+        self._connect().execute('DELETE FROM shared_state WHERE key = ?', (key,))
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        # Range over the primary key index; U+10FFFF sorts after any suffix
+        rows = self._connect().execute(
+            'SELECT key, value FROM shared_state WHERE key >= ? AND key < ? '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (prefix, prefix + '\U0010ffff', time.time())
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def acquire_lease(self, key: str, holder: str, limit: int, ttl: float,
+                      amount: int = 1) -> bool:
+        conn = self._connect()
+        now = time.time()
+        with self.transaction():
+            total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM shared_leases '
+                'WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+            if total[0] and total[1] + amount > limit:
+                return False
+            conn.execute('DELETE FROM shared_leases WHERE key = ? AND expires_at <= ?', (key, now))
+            conn.execute(
+                'INSERT OR REPLACE INTO shared_leases (key, holder, amount, expires_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, holder, amount, now + ttl)
+            )
+        return True
+
+    def release_lease(self, key: str, holder: str) -> None:
+        self._connect().execute(
+            'DELETE FROM shared_leases WHERE key = ? AND holder = ?', (key, holder)
+        )
+
+    def count_leases(self, key: str) -> int:
+        row = self._connect().execute(
+            'SELECT COALESCE(SUM(amount), 0) FROM shared_leases WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        return int(row[0])
+
+class SharedSemaphore:
+    """
+    Counting semaphore made of per-holder leases in a shared state
+    backend, so the limit holds across every worker using the same backend.
+
+    Acquisition is non-blocking (callers poll try_acquire). Each lease
+    expires `ttl` seconds after it was granted, so `ttl` must exceed the
+    longest legitimate hold; units held by a killed worker come back then,
+    however busy the semaphore is, since refused attempts extend nothing.
+    """
+
+    def __init__(self, backend: SharedStateBackend, key: str, ttl: float = 300):
+        self.backend = backend
+        self.key = key
+        self.ttl = ttl
+
+    def try_acquire(self, limit: int, amount: int = 1,
+                    lease: Optional[str] = None) -> Optional[str]:
+        """
+        Take `amount` units if the total stays within `limit`.
+
+        Returns:
+            Lease id to pass to release(), or None if refused
+        """
+        lease = lease or uuid.uuid4().hex
+        if self.backend.acquire_lease(self.key, lease, limit, self.ttl, amount):
+            return lease
+        return None
+
+    def release(self, lease: str) -> None:
+        self.backend.release_lease(self.key, lease)
+
+    def value(self) -> int:
+        return self.backend.count_leases(self.key)
+
+def create_backend(url: str) -> SharedStateBackend:
+    """
+    Create a shared state backend from a storage URL.
+
+    Supported:
+        memory://               per-process store (default)
+        sqlite:///path/to/db    SQLite WAL store shared across processes
+    """
+    parsed = urlparse(url or 'memory://')
+    if parsed.scheme == 'memory':
+        return MemoryBackend()
+    if parsed.scheme == 'sqlite':
+        path = parsed.path
+        if not path or path == '/':
+            raise ValueError('sqlite storage URL must include a database path')
+        # sqlite:///relative.db -> relative.db, sqlite:////abs.db -> /abs.db
+        return SQLiteBackend(path[1:] if path.startswith('/') else path)
+    raise ValueError(f'Unsupported storage URL scheme: {parsed.scheme}')
+
+def get_shared_state() -> SharedStateBackend:
+    """Return the shared state backend of the current app"""
+    return current_app.extensions['shared_state']
@@ -1,53 +1,139 @@
-from typing import Tuple
+import json
+from typing import Dict, IO, Iterator, Tuple
 
-def validate_analysis_request(data: dict) -> Tuple[bool, str]:
+MAX_FRAMES = 1000
+
+def validate_metadata(metadata) -> Tuple[bool, str]:
     """
-    Validate incoming analysis request data.
-    
+    Validate the metadata object of an analysis request.
+
     Returns:
         Tuple of (is_valid, error_message)
     """
-    if not data:
-        return False, "Request body cannot be empty"
-    
-    # Check metadata
-    metadata = data.get('metadata')
     if not metadata:
         return False, "Missing metadata field"
-    
+
     if not isinstance(metadata, dict):
         return False, "Metadata must be an object"
-    
+
     # Validate metadata fields
     if 'timestamp' not in metadata:
         return False, "Missing timestamp in metadata"
-    
+
     if 'duration' not in metadata:
         return False, "Missing duration in metadata"
-    
+
     if not isinstance(metadata.get('duration'), (int, float)) or metadata['duration'] <= 0:
         return False, "Duration must be a positive number"
-    
+
+    return True, ""
+
+def validate_frame(frame, index: int) -> Tuple[bool, str]:
+    """
+    Validate a single frame of an analysis request.
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    if not isinstance(frame, dict):
+        return False, f"Frame {index} is not an object"
+
+    if 'landmarks' not in frame:
+        return False, f"Frame {index} missing landmarks"
+
+    return True, ""
+
+def validate_analysis_request(data: dict, max_frames: int = MAX_FRAMES) -> Tuple[bool, str]:
+    """
+    Validate incoming analysis request data.
+
+    Args:
+        data: Parsed request body
+        max_frames: Maximum number of frames accepted
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    if not data:
+        return False, "Request body cannot be empty"
+
+    # Check metadata
+    is_valid, error_msg = validate_metadata(data.get('metadata'))
+    if not is_valid:
+        return False, error_msg
+
     # Check frames
     frames = data.get('frames')
     if frames is None:
         return False, "Missing frames field"
-    
+
     if not isinstance(frames, list):
         return False, "Frames must be an array"
-    
+
     if len(frames) == 0:
         return False, "Frames array cannot be empty"
-    
-    if len(frames) > 1000:
-        return False, "Maximum 1000 frames allowed"
-    
+
+    if len(frames) > max_frames:
+        return False, f"Maximum {max_frames} frames allowed"
+
     # Validate each frame
     for i, frame in enumerate(frames):
-        if not isinstance(frame, dict):
-            return False, f"Frame {i} is not an object"
-        
-        if 'landmarks' not in frame:
-            return False, f"Frame {i} missing landmarks"
-    
+        is_valid, error_msg = validate_frame(frame, i)
+        if not is_valid:
+            return False, error_msg
+
     return True, ""
+
+class InvalidSessionError(ValueError):
+    """Raised when a session (streamed or ordered by time) is invalid"""
+
+def read_session_stream(stream: IO[bytes], max_frames: int) -> Tuple[Dict, Iterator[Dict]]:
+    """
+    Parse a session sent as NDJSON: a first line {"metadata": {...}}
+    followed by one frame object per line, ordered by 'second'.
+
+    Metadata is validated immediately; frames are validated lazily as the
+    returned iterator consumes the stream, so the body is never held in
+    memory as a whole.
+
+    Raises:
+        InvalidSessionError: on invalid metadata (immediately) or invalid
+            frames (while iterating)
+    """
+    lines = (line for line in stream if line.strip())
+
+    try:
+        header = json.loads(next(lines))
+    except StopIteration:
+        raise InvalidSessionError("Request body cannot be empty")
+    except ValueError:
+        raise InvalidSessionError("First line must be a JSON object with metadata")
+
+    metadata = header.get('metadata') if isinstance(header, dict) else None
+    is_valid, error_msg = validate_metadata(metadata)
+    if not is_valid:
+        raise InvalidSessionError(error_msg)
+
+    def frames() -> Iterator[Dict]:
+        count = 0
+        for line in lines:
+            if count >= max_frames:
+                raise InvalidSessionError(f"Maximum {max_frames} frames allowed")
+            try:
+                frame = json.loads(line)
+            except ValueError:
+                raise InvalidSessionError(f"Frame {count} is not valid JSON")
+
+            is_valid, error_msg = validate_frame(frame, count)
+            if not is_valid:
+                raise InvalidSessionError(error_msg)
+            if not isinstance(frame.get('second'), (int, float)):
+                raise InvalidSessionError(f"Frame {count} missing numeric second")
+
+            count += 1
+            yield frame
+
+        if count == 0:
+            raise InvalidSessionError("Frames array cannot be empty")
+
+    return metadata, frames()